@@ -0,0 +1,18 @@
+from __future__ import annotations
+from pathlib import Path
+from enriquecimiento import Modulo, REGLAS_ESTANDAR, leer_filas_xlsx
+
+LABORATORIOS_DIR = Path(__file__).parent
+
+def leer_laboratorios_xlsx(xlsx_path: Path, sheet_name: str = "DETALLADO"):
+    # El reporte de laboratorios comparte el formato del DETALLADO de activos:
+    # documento en la columna B y examen en la columna E.
+    return leer_filas_xlsx(xlsx_path, sheet_name=sheet_name, col_doc=2, col_servicio=5)
+
+MODULO_LABORATORIOS = Modulo(
+    nombre="LABORATORIOS",
+    carpeta=LABORATORIOS_DIR,
+    mapeo_json=LABORATORIOS_DIR / "Laboratorios.json",
+    lector=leer_laboratorios_xlsx,
+    reglas=REGLAS_ESTANDAR,
+)
@@ -0,0 +1,117 @@
+from pathlib import Path
+import hashlib
+import os
+import pickle
+import struct
+import zlib
+
+# ==========================================================
+# CACHÉ EN DISCO DE ZIPS YA TRANSFORMADOS
+# ==========================================================
+# Archivo por ZIP: <sha256>_v<version>.bin
+#   cabecera: MAGIC
+#   lotes:    [tipo 1 byte][largo 4 bytes][pickle comprimido con zlib]
+# tipo "U" = filas de US, "E" = filas de ESTRUCTURA, en el orden de pegado.
+
+MAGIC = b"RIPSC1\n"
+LOTE_FILAS = 50000
+_frame = struct.Struct("<cI")
+
+
+def hash_archivo(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class CacheZip:
+    def __init__(self, carpeta: Path, version, max_bytes=2 * 1024 ** 3):
+        self.carpeta = Path(carpeta)
+        self.version = version
+        self.max_bytes = max_bytes
+
+    def clave(self, zip_path: Path) -> str:
+        return f"{hash_archivo(zip_path)}_v{self.version}"
+
+    def _ruta(self, clave: str) -> Path:
+        return self.carpeta / f"{clave}.bin"
+
+    def obtener(self, clave: str):
+        """Lotes [(tipo, filas), ...] si la clave está en caché y se lee completa; None si no.
+
+        La entrada se decodifica entera antes de devolverla, así un archivo
+        truncado o dañado nunca deja un pegado a medias: se borra y se retransforma.
+        """
+        ruta = self._ruta(clave)
+        if not ruta.exists():
+            return None
+        try:
+            lotes = self._leer(ruta)
+        except (OSError, ValueError, EOFError, struct.error, zlib.error, pickle.UnpicklingError) as e:
+            print(f"    ⚠️  Caché dañada ({ruta.name}): {e}. Se descarta.")
+            ruta.unlink(missing_ok=True)
+            return None
+        os.utime(ruta)  # marca de uso reciente para la expulsión
+        return lotes
+
+    def _leer(self, ruta: Path):
+        lotes = []
+        with open(ruta, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("cabecera inválida")
+            while True:
+                cab = f.read(_frame.size)
+                if not cab:
+                    break
+                tipo, largo = _frame.unpack(cab)
+                data = f.read(largo)
+                if len(data) != largo:
+                    raise ValueError("lote truncado")
+                lotes.append((tipo.decode(), pickle.loads(zlib.decompress(data))))
+        return lotes
+
+    def guardar(self, clave: str, lotes):
+        """Guarda [(tipo, filas), ...] en lotes de LOTE_FILAS y aplica el límite de tamaño."""
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        ruta = self._ruta(clave)
+        tmp = ruta.with_suffix(".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                for tipo, filas in lotes:
+                    for i in range(0, len(filas), LOTE_FILAS):
+                        data = zlib.compress(pickle.dumps(filas[i:i + LOTE_FILAS], pickle.HIGHEST_PROTOCOL))
+                        f.write(_frame.pack(tipo.encode(), len(data)))
+                        f.write(data)
+            os.replace(tmp, ruta)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self.expulsar()
+
+    def expulsar(self):
+        """Borra temporales huérfanos y los archivos usados hace más tiempo hasta quedar bajo max_bytes."""
+        # Archivos bloqueados o que desaparecen a mitad se saltan: la caché es solo una optimización
+        for tmp in self.carpeta.glob("*.tmp"):
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"    ⚠️  No se pudo borrar {tmp.name}: {e}")
+        archivos = []
+        for p in self.carpeta.glob("*.bin"):
+            try:
+                archivos.append((p, p.stat()))
+            except OSError:
+                pass
+        total = sum(st.st_size for _, st in archivos)
+        for p, st in sorted(archivos, key=lambda a: a[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"    ⚠️  No se pudo expulsar {p.name} de la caché: {e}")
+                continue
+            total -= st.st_size
@@ -0,0 +1,297 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from datetime import date
+from typing import Any, Callable
+import json
+import re
+import unicodedata
+
+# ==========================================================
+# MOTOR GENÉRICO DE ENRIQUECIMIENTO (ACTIVOS, LABORATORIOS, ...)
+# ==========================================================
+# Un módulo se declara como: lector de origen + archivo de mapeo + reglas
+# ordenadas. El motor compila todos los módulos una sola vez, lee de Excel
+# únicamente los índices que las reglas piden (una vez por corrida, compartidos
+# entre módulos) y recorre cada entrada en una sola pasada.
+
+
+_re_spaces = re.compile(r"\s+")
+
+def _strip_accents(s: str) -> str:
+    return "".join(
+        ch for ch in unicodedata.normalize("NFKD", s) if not unicodedata.combining(ch)
+    )
+
+def norm_servicio(s) -> str:
+    if s is None:
+        return ""
+    s = str(s)
+    s = _strip_accents(s)
+    s = s.upper().strip()
+    s = _re_spaces.sub(" ", s)
+    return s
+
+
+@dataclass
+class FilaOrigen:
+    rownum: int
+    tipo_doc: str
+    doc_raw: str
+    doc_norm: str
+    servicio_raw: str
+    servicio_norm: str
+
+@dataclass
+class PlanRow:
+    tipo_doc: str
+    doc_norm: str
+    fecha: date
+    codigo: str
+    nombre_homologado: str
+    l_base: str
+    m_base: str
+    base_row: int
+    servicio_raw: str
+    base_shard: int = 1
+
+
+# Claves de ctx que el motor pone antes de la primera regla
+CTX_INICIAL = ("fecha", "fecha_iso")
+# Claves de ctx que construir_plan_row necesita de las reglas
+CTX_PLAN_ROW = ("tipo", "mapeo", "base", "l", "m")
+
+
+# ==========================================================
+# LECTOR, MAPEO Y CONSTRUCTOR COMUNES A LOS MÓDULOS
+# ==========================================================
+def leer_filas_xlsx(xlsx_path: Path, sheet_name: str = "DETALLADO", col_doc: int = 2, col_servicio: int = 5) -> list[FilaOrigen]:
+    # Importes diferidos: el motor y sus reglas no dependen de openpyxl ni de COM
+    import openpyxl
+    from excel_com import norm_doc
+
+    print(f"    ... Cargando libro: {xlsx_path.name}")
+    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
+    
+    if sheet_name not in wb.sheetnames:
+        raise ValueError(f"No existe hoja '{sheet_name}'")
+    ws = wb[sheet_name]
+    
+    max_row = ws.max_row
+    print(f"    ... Procesando {max_row} filas...")
+
+    rows = []
+    for r in range(2, max_row + 1):
+        if r % 1000 == 0:
+            print(f"        -> Leídas {r} filas...", end="\r")
+            
+        doc = ws.cell(r, col_doc).value
+        serv = ws.cell(r, col_servicio).value
+        
+        if doc or serv:
+            rows.append(
+                FilaOrigen(
+                    rownum=r,
+                    tipo_doc="",
+                    doc_raw=str(doc or "").strip(),
+                    doc_norm=norm_doc(doc),
+                    servicio_raw=str(serv or "").strip(),
+                    servicio_norm=norm_servicio(serv)
+                )
+            )
+    print(f"\n    ✅  Lectura completada. {len(rows)} filas válidas.")
+    return rows
+
+def cargar_mapeo_json(json_path: Path) -> dict:
+    data = json.loads(json_path.read_text(encoding="utf-8"))
+    return {
+        norm_servicio(i["entrada"]): {
+            "transformacion": (i.get("transformacion") or "").strip(),
+            "codigo": (i.get("codigo") or "").strip()
+        } 
+        for i in data if norm_servicio(i.get("entrada"))
+    }
+
+def construir_plan_row(fila: FilaOrigen, ctx: dict) -> PlanRow:
+    m = ctx["mapeo"]
+    return PlanRow(
+        tipo_doc=ctx["tipo"],
+        doc_norm=fila.doc_norm,
+        fecha=ctx["fecha"],
+        codigo=m["codigo"],
+        nombre_homologado=m.get("transformacion"),
+        l_base=ctx["l"],
+        m_base=ctx["m"],
+        base_row=ctx["base"]["row"],
+        servicio_raw=fila.servicio_raw,
+        base_shard=ctx["base"].get("shard", 1)
+    )
+
+
+@dataclass(frozen=True)
+class Regla:
+    motivo: str
+    fn: Callable[[Any, dict, dict], bool]
+    indice: str | None = None
+    requiere: tuple[str, ...] = ()   # claves de ctx que lee
+    produce: tuple[str, ...] = ()    # claves de ctx que deja listas si la fila pasa
+
+
+@dataclass
+class Modulo:
+    nombre: str
+    carpeta: Path
+    mapeo_json: Path
+    lector: Callable[[Path], list] = leer_filas_xlsx
+    cargar_mapeo: Callable[[Path], dict] = cargar_mapeo_json
+    construir: Callable[[Any, dict], Any] = construir_plan_row
+    reglas: list[Regla] = field(default_factory=list)
+    construir_requiere: tuple[str, ...] = CTX_PLAN_ROW
+
+
+def _doc_to_tipo(us_keys) -> dict:
+    out = {}
+    for k in us_keys:
+        parts = k.split("|")
+        if len(parts) == 2:
+            out[parts[1]] = parts[0]
+    return out
+
+
+# Índice propio de cada módulo, cargado desde su archivo de mapeo
+INDICE_MAPEO = "mapeo"
+
+# Cargadores de índices compartidos: nombre -> función(excel)
+INDICES = {
+    "us_tipo": lambda excel: _doc_to_tipo(excel.cargar_us_keyset()),
+    "base_lm": lambda excel: excel.cargar_estructura_base_lm(),
+    "dedupe": lambda excel: excel.cargar_estructura_dedupe_activos(),
+}
+
+
+def _key_dupe(doc, codigo, fecha_iso) -> str:
+    return f"{doc}|{codigo}|{fecha_iso}"
+
+
+# ==========================================================
+# REGLAS ESTÁNDAR (fila, ctx, idx) -> True si la fila sigue
+# ==========================================================
+def _no_vacio(fila, ctx, idx):
+    return bool(fila.doc_norm and fila.servicio_norm)
+
+def _existe_us(fila, ctx, idx):
+    ctx["tipo"] = idx["us_tipo"].get(fila.doc_norm)
+    return bool(ctx["tipo"])
+
+def _con_mapeo(fila, ctx, idx):
+    ctx["mapeo"] = idx["mapeo"].get(fila.servicio_norm)
+    return bool(ctx["mapeo"])
+
+def _no_excluido(fila, ctx, idx):
+    return ctx["mapeo"].get("transformacion") != "QUITAR"
+
+def _con_base(fila, ctx, idx):
+    ctx["base"] = idx["base_lm"].get(fila.doc_norm)
+    return bool(ctx["base"])
+
+def _base_con_lm(fila, ctx, idx):
+    ctx["l"] = str(ctx["base"]["L"]).strip()
+    ctx["m"] = str(ctx["base"]["M"]).strip()
+    return bool(ctx["l"] and ctx["m"])
+
+def _no_duplicado(fila, ctx, idx):
+    return _key_dupe(fila.doc_norm, ctx["mapeo"]["codigo"], ctx["fecha_iso"]) not in idx["dedupe"]
+
+
+REGLA_NO_VACIO = Regla("DOC_O_SERV_VACIO", _no_vacio)
+REGLA_EXISTE_US = Regla("NO_EXISTE_EN_US", _existe_us, indice="us_tipo", produce=("tipo",))
+REGLA_MAPEO = Regla("NO_MAPEO_EN_JSON", _con_mapeo, indice=INDICE_MAPEO, produce=("mapeo",))
+REGLA_NO_EXCLUIDO = Regla("SERVICIO_EXCLUIDO", _no_excluido, requiere=("mapeo",))
+REGLA_BASE = Regla("NO_BASE_ESTRUCTURA", _con_base, indice="base_lm", produce=("base",))
+REGLA_BASE_LM = Regla("BASE_SIN_LM", _base_con_lm, requiere=("base",), produce=("l", "m"))
+REGLA_NO_DUPLICADO = Regla("DUPLICADO_YA_EXISTE", _no_duplicado, indice="dedupe", requiere=("mapeo", "fecha_iso"))
+
+# Cadena usada por Activos: US tipo -> mapeo JSON -> base L/M -> dedupe
+REGLAS_ESTANDAR = [
+    REGLA_NO_VACIO,
+    REGLA_EXISTE_US,
+    REGLA_MAPEO,
+    REGLA_NO_EXCLUIDO,
+    REGLA_BASE,
+    REGLA_BASE_LM,
+    REGLA_NO_DUPLICADO,
+]
+
+
+def _validar_ctx(modulo: Modulo):
+    """Comprueba en orden que cada regla y el constructor solo lean claves ya producidas."""
+    disponibles = set(CTX_INICIAL)
+    for r in modulo.reglas:
+        faltan = set(r.requiere) - disponibles
+        if faltan:
+            raise ValueError(f"{modulo.nombre}: la regla {r.motivo} requiere {sorted(faltan)} antes de producirse")
+        disponibles.update(r.produce)
+    faltan = set(modulo.construir_requiere) - disponibles
+    if faltan:
+        raise ValueError(f"{modulo.nombre}: ninguna regla produce {sorted(faltan)} para el constructor")
+
+
+class MotorEnriquecimiento:
+    def __init__(self, modulos):
+        self.modulos = {m.nombre: m for m in modulos}
+        for m in modulos:
+            _validar_ctx(m)
+        # Compilación: reglas como tuplas (motivo, fn) y unión de índices requeridos
+        self._reglas = {
+            m.nombre: tuple((r.motivo, r.fn) for r in m.reglas) for m in modulos
+        }
+        declarados = {r.indice for m in modulos for r in m.reglas if r.indice}
+        desconocidos = declarados - INDICES.keys() - {INDICE_MAPEO}
+        if desconocidos:
+            raise ValueError(f"Índices desconocidos: {sorted(desconocidos)}")
+        self.requeridos = declarados - {INDICE_MAPEO}
+        self._usa_mapeo = {
+            m.nombre: any(r.indice == INDICE_MAPEO for r in m.reglas) for m in modulos
+        }
+        self.indices = None
+        self._mapeos = {}
+
+    def cargar_indices(self, excel):
+        """Lee de Excel los índices requeridos una sola vez para todos los módulos."""
+        if self.indices is None:
+            self.indices = {nombre: INDICES[nombre](excel) for nombre in sorted(self.requeridos)}
+        return self.indices
+
+    def mapeo(self, nombre):
+        if nombre not in self._mapeos:
+            m = self.modulos[nombre]
+            self._mapeos[nombre] = m.cargar_mapeo(m.mapeo_json)
+        return self._mapeos[nombre]
+
+    def ejecutar(self, excel, nombre, filas, fecha, mapeo=None):
+        modulo = self.modulos[nombre]
+        reglas = self._reglas[nombre]
+        idx = dict(self.cargar_indices(excel))
+        if self._usa_mapeo[nombre]:
+            idx[INDICE_MAPEO] = mapeo if mapeo is not None else self.mapeo(nombre)
+        fecha_iso = fecha.isoformat()
+
+        plan = []
+        descartes = []
+        for fila in filas:
+            ctx = {"fecha": fecha, "fecha_iso": fecha_iso}  # CTX_INICIAL
+            for motivo, fn in reglas:
+                if not fn(fila, ctx, idx):
+                    descartes.append({"row_excel": fila.rownum, "reason": motivo, "servicio": fila.servicio_raw})
+                    break
+            else:
+                plan.append(modulo.construir(fila, ctx))
+        return plan, descartes
+
+    def registrar_insertados(self, plan):
+        """Actualiza en memoria el índice de duplicados tras insertar, sin releer la hoja."""
+        if self.indices is None or "dedupe" not in self.indices:
+            return
+        dupes = self.indices["dedupe"]
+        for p in plan:
+            dupes.add(_key_dupe(p.doc_norm, p.codigo, p.fecha.isoformat()))
@@ -1,11 +1,15 @@
 import win32com.client as win32
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import json
+import shutil
 import re
 import math
 from datetime import datetime, date, timedelta
 
 XL_UP = -4162
 CONTROL_SHEET = "__RIPS_CONTROL__"
+EXCEL_MAX_FILAS = 1048576
 _re_non_digits = re.compile(r"\D+")
 
 def norm_doc(v):
@@ -46,22 +50,43 @@ def _norm_fecha_key(v) -> str:
 
 
 class ExcelCOM:
-    def __init__(self, path_xlsm: Path):
-        self.path = str(path_xlsm.resolve())
+    def __init__(self, path_xlsm: Path, plantilla_maestra=None, max_filas=None):
+        self.base_path = path_xlsm.resolve()
+        self.path = str(self.base_path)
         self.excel = None
         self.wb = None
         self.ws_estructura = None
         self.ws_us = None
         self.ws_control = None
         self.seen_us = set()
+        # Con plantilla maestra, ESTRUCTURA se reparte en varios libros (shards)
+        # cuando llega al límite de filas de Excel.
+        self.plantilla_maestra = plantilla_maestra
+        self.max_filas = max_filas
+        self.manifest_path = self.base_path.with_name(f"{self.base_path.stem}_shards.json")
+        self.shards = []
+        self._manifest_cargado = False
+        self._indices_estructura = None
 
-    def abrir(self):
+    def abrir(self, solo_libro=False):
         self.excel = win32.DispatchEx("Excel.Application")
         self.excel.Visible = False
         self.excel.DisplayAlerts = False
+        if solo_libro:
+            # Solo el libro y ESTRUCTURA: sin manifiesto, control ni claves US
+            self.wb = self.excel.Workbooks.Open(self.path)
+            self.ws_estructura = self.wb.Worksheets("ESTRUCTURA")
+            return
+        self._cargar_manifest()
+        self._abrir_libro(self.base_path.with_name(self.shards[-1]["archivo"]))
+
+    def _abrir_libro(self, path: Path):
+        self.path = str(path)
         self.wb = self.excel.Workbooks.Open(self.path)
         self.ws_estructura = self.wb.Worksheets("ESTRUCTURA")
         self.ws_us = self.wb.Worksheets("US")
+        if self.max_filas is None:
+            self.max_filas = min(EXCEL_MAX_FILAS, int(self.ws_estructura.Rows.Count))
         self._init_control()
         self._load_seen_us()
 
@@ -69,8 +94,112 @@ class ExcelCOM:
         if self.wb:
             self.wb.Save()
             self.wb.Close(SaveChanges=False)
+            self.wb = None
         if self.excel:
             self.excel.Quit()
+        self._guardar_manifest()
+
+    # ==========================================================
+    # SHARDS: VARIOS LIBROS CUANDO ESTRUCTURA SE LLENA
+    # ==========================================================
+    def _cargar_manifest(self):
+        self.shards = []
+        if self.manifest_path.exists():
+            self.shards = json.loads(self.manifest_path.read_text(encoding="utf-8"))["shards"]
+        if not self.shards:
+            self.shards = [self._nuevo_shard(1, self.base_path.name)]
+        self._manifest_cargado = True
+
+    @staticmethod
+    def _nuevo_shard(indice, archivo):
+        return {"indice": indice, "archivo": archivo, "estructura_desde": None, "estructura_hasta": None, "formulas": False}
+
+    def _guardar_manifest(self):
+        # Nunca pisar el manifiesto si no se llegó a cargar (p. ej. abrir() falló antes)
+        if not self._manifest_cargado or not self.shards:
+            return
+        # Un solo libro no necesita manifiesto, salvo que ya exista de una corrida anterior
+        if len(self.shards) < 2 and not self.manifest_path.exists():
+            return
+        data = {"plantilla": self.base_path.name, "max_filas": self.max_filas, "shards": self.shards}
+        self.manifest_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    def shards_cerrados(self):
+        """Rutas de los libros ya llenos (todos menos el abierto) que aún no tienen fórmulas."""
+        return [str(self.base_path.with_name(s["archivo"])) for s in self.shards[:-1] if not s.get("formulas")]
+
+    def marcar_formulas(self, paths):
+        nombres = {Path(p).name for p in paths}
+        for s in self.shards:
+            if s["archivo"] in nombres: s["formulas"] = True
+        self._guardar_manifest()
+
+    def _hojas_estructura(self):
+        """(índice, hoja ESTRUCTURA) de cada shard en orden; los cerrados se abren en solo lectura."""
+        for shard in self.shards[:-1]:
+            wb = self.excel.Workbooks.Open(str(self.base_path.with_name(shard["archivo"])), ReadOnly=True)
+            try:
+                yield shard["indice"], wb.Worksheets("ESTRUCTURA")
+            finally:
+                wb.Close(SaveChanges=False)
+        yield self.shards[-1]["indice"], self.ws_estructura
+
+    def _registrar_filas(self, start, end):
+        shard = self.shards[-1]
+        if shard["estructura_desde"] is None or start < shard["estructura_desde"]:
+            shard["estructura_desde"] = start
+        if shard["estructura_hasta"] is None or end > shard["estructura_hasta"]:
+            shard["estructura_hasta"] = end
+
+    def _leer_filas(self, ws, col_ini, col_fin, fila_ini, col_fin_datos):
+        last = self.ultima_fila(ws, col_fin_datos)
+        if last < fila_ini: return None, fila_ini
+        return ws.Range(f"{col_ini}{fila_ini}:{col_fin}{last}").Value, last
+
+    def _rotar_shard(self):
+        if not self.plantilla_maestra or not Path(self.plantilla_maestra).exists():
+            raise RuntimeError(f"ESTRUCTURA llegó al límite de {self.max_filas} filas y no hay plantilla maestra para continuar")
+
+        indice = len(self.shards) + 1
+        destino = self.base_path.with_name(f"{self.base_path.stem}_{indice:03d}{self.base_path.suffix}")
+        if destino.exists():
+            raise RuntimeError(f"{destino.name} ya existe y no figura en el manifiesto; no se sobrescribe")
+
+        # US y control viajan al nuevo libro en las mismas posiciones,
+        # así la fila siguiente de US y las claves de dedupe siguen siendo válidas.
+        us, us_last = self._leer_filas(self.ws_us, "A", "N", 2, 2)
+        control, control_last = self._leer_filas(self.ws_control, "A", "B", 2, 1)
+
+        self.wb.Save()
+        self.wb.Close(SaveChanges=False)
+
+        shutil.copy2(self.plantilla_maestra, destino)
+        self.shards.append(self._nuevo_shard(indice, destino.name))
+        print(f"    📚  ESTRUCTURA llena. Continuando en {destino.name}")
+
+        self._abrir_libro(destino)
+        if us:
+            self.ws_us.Range(f"A2:N{us_last}").Value = us
+        if control:
+            self.ws_control.Range(f"A2:B{control_last}").Value = control
+        self._guardar_manifest()
+
+    def _pegar_estructura(self, filas, fila_inicio, col_ini, col_fin):
+        i = 0
+        while i < len(filas):
+            capacidad = self.max_filas - fila_inicio + 1
+            if capacidad <= 0:
+                self._rotar_shard()
+                fila_inicio = self.siguiente_fila(self.ws_estructura, 5)
+                continue
+            bloque = filas[i:i + capacidad]
+            end = fila_inicio + len(bloque) - 1
+            self.ws_estructura.Range(f"{col_ini}{fila_inicio}:{col_fin}{end}").Value = bloque
+            self._indices_estructura = None
+            self._registrar_filas(fila_inicio, end)
+            i += len(bloque)
+            fila_inicio = end + 1
+        return fila_inicio
 
     def _init_control(self):
         try: self.ws_control = self.wb.Worksheets(CONTROL_SHEET)
@@ -98,19 +227,27 @@ class ExcelCOM:
         end = start + len(data) - 1
         self.ws_control.Range(f"A{start}:B{end}").Value = data
 
+    def _fila_final(self, ws, col):
+        # End(xlUp) desde una celda llena salta al inicio de su bloque: columna llena hasta el final
+        total = int(ws.Rows.Count)
+        valor = ws.Cells(total, col).Value
+        if valor is not None and valor != "": return total
+        return int(ws.Cells(total, col).End(XL_UP).Row)
+
     def siguiente_fila(self, ws, col):
-        last_row = ws.Cells(ws.Rows.Count, col).End(XL_UP).Row
+        last_row = self._fila_final(ws, col)
         return max(3, last_row + 1)
 
     def ultima_fila(self, ws, col):
-        last = ws.Cells(ws.Rows.Count, col).End(XL_UP).Row
+        last = self._fila_final(ws, col)
         return max(1, int(last))
 
     # ==========================================================
     # ARRASTRAR FÓRMULAS CON R1C1
     # ==========================================================
     def arrastrar_formulas(self, sheet_name, fila_ref, fila_inicio, fila_fin, col_max=50):
-        if fila_inicio > fila_fin: return
+        """Copia las fórmulas de fila_ref hacia abajo; devuelve False si alguna columna falló."""
+        if fila_inicio > fila_fin: return True
         ws = self.wb.Sheets(sheet_name)
         self.excel.ScreenUpdating = False
         try:
@@ -122,8 +259,10 @@ class ExcelCOM:
                     rango_destino.FormulaR1C1 = formula_relativa
         except Exception as e:
             print(f"    ⚠️ Error arrastrando fórmulas col {col}: {e}")
+            return False
         finally:
             self.excel.ScreenUpdating = True
+        return True
 
     # ==========================================================
     # BARRIDO DE FECHAS COLUMNA F (CON HORA Y APÓSTROFE)
@@ -190,10 +329,7 @@ class ExcelCOM:
 
     def pegar_estructura_rango(self, filas, fila_inicio):
         if not filas: return fila_inicio
-        start = fila_inicio
-        end = fila_inicio + len(filas) - 1
-        self.ws_estructura.Range(f"E{start}:L{end}").Value = filas
-        return end + 1
+        return self._pegar_estructura(filas, fila_inicio, "E", "L")
 
     def pegar_us_rango(self, filas, fila_inicio):
         nuevos = []
@@ -228,31 +364,33 @@ class ExcelCOM:
             if tipo and doc: out.add(f"{tipo}|{doc}")
         return out
 
+    def cargar_estructura_indices(self):
+        """Base L/M y claves de dedupe de todos los shards, leyendo E2:M una sola vez por hoja."""
+        if self._indices_estructura is not None:
+            return self._indices_estructura
+        base, dupes = {}, set()
+        for shard, ws in self._hojas_estructura():
+            last = self.ultima_fila(ws, 5)
+            if last < 2: continue
+            rng = ws.Range(f"E2:M{last}").Value
+            if not rng: continue
+            if not isinstance(rng[0], (list, tuple)): rng = [rng]
+            row_idx = 2
+            for row in rng:
+                doc = norm_doc(row[0])
+                if doc:
+                    if doc not in base: base[doc] = {"row": row_idx, "L": row[7], "M": row[8], "shard": shard}
+                    fecha_key, codigo = _norm_fecha_key(row[1]), (str(row[3]).strip() if row[3] else "")
+                    if fecha_key and codigo: dupes.add(f"{doc}|{codigo}|{fecha_key}")
+                row_idx += 1
+        self._indices_estructura = (base, dupes)
+        return self._indices_estructura
+
     def cargar_estructura_base_lm(self):
-        last = self.ultima_fila(self.ws_estructura, 5)
-        if last < 2: return {}
-        rng = self.ws_estructura.Range(f"E2:M{last}").Value
-        out = {}
-        if not rng: return out
-        if not isinstance(rng[0], (list, tuple)): rng = [rng]
-        row_idx = 2
-        for row in rng:
-            doc = norm_doc(row[0])
-            if doc and doc not in out: out[doc] = {"row": row_idx, "L": row[7], "M": row[8]}
-            row_idx += 1
-        return out
+        return self.cargar_estructura_indices()[0]
 
     def cargar_estructura_dedupe_activos(self):
-        last = self.ultima_fila(self.ws_estructura, 5)
-        if last < 2: return set()
-        rng = self.ws_estructura.Range(f"E2:H{last}").Value
-        out = set()
-        if not rng: return out
-        if not isinstance(rng[0], (list, tuple)): rng = [rng]
-        for row in rng:
-            doc, fecha_key, codigo = norm_doc(row[0]), _norm_fecha_key(row[1]), (str(row[3]).strip() if row[3] else "")
-            if doc and fecha_key and codigo: out.add(f"{doc}|{codigo}|{fecha_key}")
-        return out
+        return self.cargar_estructura_indices()[1]
 
     def pegar_activos_estructura(self, plan_rows, fila_inicio):
         if not plan_rows: return fila_inicio
@@ -260,6 +398,32 @@ class ExcelCOM:
         for p in plan_rows:
             # Enviamos fecha con 00:00 predeterminado; el barrido final pondrá el apóstrofe y dejará todo limpio
             data.append([p.tipo_doc, p.doc_norm, f"{p.fecha.strftime('%Y-%m-%d')} 00:00", "", p.codigo, "", "", p.nombre_homologado, p.l_base, p.m_base])
-        start, end = fila_inicio, fila_inicio + len(data) - 1
-        self.ws_estructura.Range(f"D{start}:M{end}").Value = data
-        return end + 1
\ No newline at end of file
+        return self._pegar_estructura(data, fila_inicio, "D", "M")
+
+
+# ==========================================================
+# RELLENO DE FÓRMULAS POR SHARD (UN EXCEL POR PROCESO)
+# ==========================================================
+def arrastrar_formulas_libro(path, sheet_name="ESTRUCTURA", fila_ref=2, fila_inicio=3, col_datos=5):
+    excel = ExcelCOM(Path(path))
+    try:
+        excel.abrir(solo_libro=True)
+        ultima = excel.ultima_fila(excel.wb.Sheets(sheet_name), col_datos)
+        if ultima >= fila_inicio and not excel.arrastrar_formulas(sheet_name, fila_ref, fila_inicio, ultima):
+            raise RuntimeError(f"Relleno de fórmulas incompleto en {Path(path).name}")
+        return ultima
+    finally:
+        excel.cerrar()
+
+def arrastrar_formulas_paralelo(paths, max_workers=None):
+    """Rellena y guarda cada libro en su propio proceso; devuelve {ruta: última fila} de los exitosos."""
+    if not paths: return {}
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futuros = {pool.submit(arrastrar_formulas_libro, p): p for p in paths}
+        for futuro, path in futuros.items():
+            try:
+                resultados[path] = futuro.result()
+            except Exception as e:
+                print(f"    ⚠️ Error arrastrando fórmulas en {Path(path).name}: {e}")
+    return resultados
\ No newline at end of file
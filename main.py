@@ -2,27 +2,45 @@ import sys
 from pathlib import Path
 import zipfile
 import shutil
+import multiprocessing
 import csv
 from datetime import datetime
 
 # Importamos módulos propios
 from texto_en_col import normalizar_carpeta_csv
-from excel_com import ExcelCOM
+from excel_com import ExcelCOM, arrastrar_formulas_paralelo
+from reset_excel import RUTA_MAESTRA
+from cache_zip import CacheZip
+from enriquecimiento import Modulo, MotorEnriquecimiento
 from Activos.activos_proc import (
-    cargar_mapeo_activos, 
-    leer_activos_xlsx, 
-    construir_plan_activos, 
+    MODULO_ACTIVOS,
     exportar_auditoria_csv, 
     parse_fecha_usuario
 )
+from Laboratorios.laboratorios_proc import MODULO_LABORATORIOS
 
 BASE_DIR = Path(__file__).parent
 ZIP_DIR = BASE_DIR / "zip"
 WORK_DIR = BASE_DIR / "_work"
 PLANTILLA = BASE_DIR / "RIPS_COMFE_PLANTILLA.xlsm"
+PLANTILLA_MAESTRA = Path(RUTA_MAESTRA)
 
-ACTIVOS_DIR = BASE_DIR / "Activos"
-ACTIVOS_JSON = ACTIVOS_DIR / "Activos.json"
+CACHE_DIR = BASE_DIR / "_cache"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Columnas CSV -> columnas E:L de ESTRUCTURA por tipo de archivo RIPS
+MAPAS_ESTRUCTURA = {
+    "AT": {3: 0, 4: 1, 7: 6, 11: 7},
+    "AP": {3: 0, 4: 1, 10: 4, 15: 6, 16: 7},
+    "AC": {3: 0, 4: 1, 9: 4, 17: 6, 18: 7}
+}
+# Subir al cambiar cualquier paso que produce las filas cacheadas (invalida la caché):
+# MAPAS_ESTRUCTURA, formatear_fecha_rips, transformar_zip, extraer_zip, iter_csv
+# y texto_en_col.normalizar_csv / normalizar_carpeta_csv
+TRANSFORM_VERSION = 1
+
+# Módulos de enriquecimiento, en orden de ejecución. Comparten los índices leídos de Excel.
+MODULOS = [MODULO_ACTIVOS, MODULO_LABORATORIOS]
 
 def formatear_fecha_rips(fecha_str):
     """
@@ -73,18 +91,47 @@ def extraer_zip(zip_path: Path) -> Path:
     with zipfile.ZipFile(zip_path) as z: z.extractall(destino)
     return destino
 
-def procesar_activos(excel: ExcelCOM):
+def transformar_zip(zip_file: Path):
+    """Extrae y normaliza el ZIP; devuelve [("U", filas_us), ("E", filas_estructura)]."""
+    carpeta = extraer_zip(zip_file)
+    print("    🛠️  Normalizando CSVs...")
+    normalizar_carpeta_csv(carpeta)
+
+    filas_us = []
+    path_us = next(carpeta.glob("US*.CSV"), None)
+    if path_us:
+        for r in iter_csv(path_us):
+            filas_us.append((r + [""] * 14)[:14])
+
+    filas_est = []
+    for tipo, mapa in MAPAS_ESTRUCTURA.items():
+        path = next(carpeta.glob(f"{tipo}*.CSV"), None)
+        if path:
+            for r in iter_csv(path):
+                row_data = [""] * 8
+                for idx_csv, idx_list in mapa.items():
+                    if idx_csv < len(r):
+                        valor = r[idx_csv]
+                        # Interceptamos la fecha para darle el formato correcto
+                        if idx_list == 1:
+                            valor = formatear_fecha_rips(valor)
+                        row_data[idx_list] = valor
+                filas_est.append(row_data)
+
+    return [("U", filas_us), ("E", filas_est)]
+
+def procesar_modulo(excel: ExcelCOM, motor: MotorEnriquecimiento, modulo: Modulo):
     print("\n" + "="*50)
-    print("🏥  MÓDULO DE ACTIVOS FIJOS")
+    print(f"🏥  MÓDULO DE {modulo.nombre}")
     print("="*50)
 
-    xlsx = next(ACTIVOS_DIR.glob("*.xlsx"), None)
+    xlsx = next(modulo.carpeta.glob("*.xlsx"), None)
     if not xlsx:
-        print("⚠️  No se encontró archivo Excel (.xlsx) en la carpeta 'Activos'. Saltando...")
+        print(f"⚠️  No se encontró archivo Excel (.xlsx) en la carpeta '{modulo.carpeta.name}'. Saltando...")
         return
     
-    if not ACTIVOS_JSON.exists():
-        print("⚠️  No se encontró 'Activos.json'. Saltando...")
+    if not modulo.mapeo_json.exists():
+        print(f"⚠️  No se encontró '{modulo.mapeo_json.name}'. Saltando...")
         return
 
     print(f"📄  Archivo encontrado: {xlsx.name}")
@@ -97,26 +144,27 @@ def procesar_activos(excel: ExcelCOM):
         except Exception as e:
             print(f"❌  Error: {e}. Intente de nuevo.")
 
-    print(f"\n⏳  Leyendo archivo de activos...")
-    activos_rows = leer_activos_xlsx(xlsx, sheet_name="DETALLADO")
+    print(f"\n⏳  Leyendo archivo de {modulo.nombre.lower()}...")
+    filas = modulo.lector(xlsx)
     
-    print(f"🔍  Cruzando {len(activos_rows)} registros con la base de datos...")
-    plan, descartes = construir_plan_activos(excel, activos_rows, cargar_mapeo_activos(ACTIVOS_JSON), fecha)
+    print(f"🔍  Cruzando {len(filas)} registros con la base de datos...")
+    plan, descartes = motor.ejecutar(excel, modulo.nombre, filas, fecha)
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    csv_audit = BASE_DIR / f"auditoria_activos_{timestamp}.csv"
+    csv_audit = BASE_DIR / f"auditoria_{modulo.nombre.lower()}_{timestamp}.csv"
     exportar_auditoria_csv(csv_audit, plan, descartes)
     print(f"📊  Auditoría guardada en: {csv_audit.name}")
     print(f"    - Insertables: {len(plan)}")
     print(f"    - Descartados: {len(descartes)}")
 
     if plan:
-        resp = input("\n✍️  ¿Desea insertar estos activos en la hoja ESTRUCTURA? (SI/NO): ").strip().upper()
+        resp = input(f"\n✍️  ¿Desea insertar estos registros de {modulo.nombre.lower()} en la hoja ESTRUCTURA? (SI/NO): ").strip().upper()
         if resp == "SI":
             print("⏳  Insertando en Excel...")
             fila_inicio = excel.siguiente_fila(excel.ws_estructura, 5)
             excel.pegar_activos_estructura(plan, fila_inicio)
-            print("✅  Inserción de activos completada.")
+            motor.registrar_insertados(plan)
+            print(f"✅  Inserción de {modulo.nombre.lower()} completada.")
         else:
             print("info  Operación cancelada.")
     else:
@@ -133,8 +181,15 @@ def main():
         return
 
     print(f"📦  Archivos ZIP encontrados: {len(zips)}")
+    maestra = PLANTILLA_MAESTRA
+    if not maestra.exists():
+        print(f"⚠️  No se encontró la plantilla maestra: {maestra}")
+        print("    Si ESTRUCTURA se llena no se podrá continuar en otro libro. Revise RUTA_MAESTRA en reset_excel.py.")
+        maestra = None
+
     print("⏳  Abriendo Excel (modo oculto)...")
-    excel = ExcelCOM(PLANTILLA)
+    excel = ExcelCOM(PLANTILLA, plantilla_maestra=maestra)
+    cache = CacheZip(CACHE_DIR, TRANSFORM_VERSION, max_bytes=CACHE_MAX_BYTES)
     
     try:
         excel.abrir()
@@ -149,57 +204,52 @@ def main():
         # ========================================================
         for i, zip_file in enumerate(zips, 1):
             print(f"\n[{i}/{len(zips)}] 📂 Procesando ZIP: {zip_file.name}")
-            carpeta = extraer_zip(zip_file)
-            print("    🛠️  Normalizando CSVs...")
-            normalizar_carpeta_csv(carpeta)
-
-            filas_est = []
-            mapas = {
-                "AT": {3: 0, 4: 1, 7: 6, 11: 7},
-                "AP": {3: 0, 4: 1, 10: 4, 15: 6, 16: 7},
-                "AC": {3: 0, 4: 1, 9: 4, 17: 6, 18: 7}
-            }
-
-            for tipo, mapa in mapas.items():
-                path = next(carpeta.glob(f"{tipo}*.CSV"), None)
-                if path:
-                    for r in iter_csv(path):
-                        row_data = [""] * 8
-                        for idx_csv, idx_list in mapa.items():
-                            if idx_csv < len(r):
-                                valor = r[idx_csv]
-                                # Interceptamos la fecha para darle el formato correcto
-                                if idx_list == 1:
-                                    valor = formatear_fecha_rips(valor)
-                                row_data[idx_list] = valor
-                        filas_est.append(row_data)
-
-            if filas_est:
-                print(f"    💾  Pegando {len(filas_est)} filas en ESTRUCTURA...")
-                fila_estructura = excel.pegar_estructura_rango(filas_est, fila_estructura)
+            clave = cache.clave(zip_file)
+            lotes = cache.obtener(clave)
+            if lotes is not None:
+                print("    ⚡  Usando filas ya transformadas desde la caché.")
             else:
-                print("    ⚠️  No hay datos de estructura en este ZIP.")
+                lotes = transformar_zip(zip_file)
+                try:
+                    cache.guardar(clave, lotes)
+                except OSError as e:
+                    print(f"    ⚠️  No se pudo guardar en caché ({e}). Se continúa sin caché.")
 
-            filas_us = []
-            path_us = next(carpeta.glob("US*.CSV"), None)
-            if path_us:
-                for r in iter_csv(path_us):
-                    filas_us.append((r + [""] * 14)[:14])
-                
-                if filas_us:
-                    print(f"    👥  Procesando {len(filas_us)} usuarios...")
-                    fila_us = excel.pegar_us_rango(filas_us, fila_us)
-            else:
-                print("    ⚠️  No hay archivo US.")
+            # US primero: si ESTRUCTURA cambia de libro, el nuevo ya lleva los usuarios de este ZIP
+            total = {"U": 0, "E": 0}
+            for tipo, filas in lotes:
+                if not filas: continue
+                total[tipo] += len(filas)
+                if tipo == "U":
+                    print(f"    👥  Procesando {len(filas)} usuarios...")
+                    fila_us = excel.pegar_us_rango(filas, fila_us)
+                else:
+                    print(f"    💾  Pegando {len(filas)} filas en ESTRUCTURA...")
+                    fila_estructura = excel.pegar_estructura_rango(filas, fila_estructura)
+
+            if not total["U"]:
+                print("    ⚠️  No hay datos de US en este ZIP.")
+            if not total["E"]:
+                print("    ⚠️  No hay datos de estructura en este ZIP.")
 
         # ========================================================
-        # 2. PEGADO MASIVO DE ACTIVOS FIJOS
+        # 2. PEGADO MASIVO DE ACTIVOS FIJOS Y LABORATORIOS
         # ========================================================
-        procesar_activos(excel)
+        motor = MotorEnriquecimiento(MODULOS)
+        for modulo in MODULOS:
+            procesar_modulo(excel, motor, modulo)
         
         # ========================================================
         # 3. AJUSTE FINAL: ARRASTRAR FÓRMULAS
         # ========================================================
+        cerrados = excel.shards_cerrados()
+        if cerrados:
+            print(f"\n⚙️  Arrastrando fórmulas en {len(cerrados)} libro(s) adicional(es) en paralelo...")
+            resultados = arrastrar_formulas_paralelo(cerrados)
+            for path, ultima in resultados.items():
+                print(f"   ✅  {Path(path).name}: hasta la fila {ultima}")
+            excel.marcar_formulas(resultados)
+
         ultima_fila_datos = excel.ultima_fila(excel.ws_estructura, 5) # Columna E determina el fin de los datos
         
         if ultima_fila_datos >= 3:
@@ -207,8 +257,10 @@ def main():
             print("⚙️  APLICANDO AJUSTES FINALES A ESTRUCTURA")
             print("="*50)
             print(f"   🪄  Arrastrando fórmulas de la fila 2 hasta la {ultima_fila_datos}...")
-            excel.arrastrar_formulas("ESTRUCTURA", 2, 3, ultima_fila_datos)
-            print("   ✅  Ajustes finalizados con éxito.")
+            if excel.arrastrar_formulas("ESTRUCTURA", 2, 3, ultima_fila_datos):
+                print("   ✅  Ajustes finalizados con éxito.")
+            else:
+                print("   ⚠️  El arrastre de fórmulas quedó incompleto. Vuelva a ejecutar para reintentar.")
 
     except Exception as e:
         print(f"\n❌  ERROR CRÍTICO: {e}")
@@ -220,4 +272,5 @@ def main():
         print("✨  ¡Proceso Finalizado!")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -1,16 +1,27 @@
 import os
+import glob
 import shutil
 
+# Definición de rutas
+RUTA_MAESTRA = r"C:\Users\FELIPE SISTEMAS\Documents\GOYE\COMFENALCO\RIPS_COMFE_PLANTILL_ORIGINAL.xlsm"
+RUTA_DESTINO = r"C:\Users\FELIPE SISTEMAS\Documents\GOYE\COMFENALCO\CODIGO\RIPS_COMFE_PLANTILLA.xlsm"
+
 def resetear_plantilla():
-    # Definición de rutas
-    ruta_maestra = r"C:\Users\FELIPE SISTEMAS\Documents\GOYE\COMFENALCO\RIPS_COMFE_PLANTILL_ORIGINAL.xlsm"
-    ruta_destino = r"C:\Users\FELIPE SISTEMAS\Documents\GOYE\COMFENALCO\CODIGO\RIPS_COMFE_PLANTILLA.xlsm"
+    ruta_maestra = RUTA_MAESTRA
+    ruta_destino = RUTA_DESTINO
+    base, ext = os.path.splitext(ruta_destino)
 
     try:
         # 1. Borrar el archivo en el destino si existe
         if os.path.exists(ruta_destino):
             os.remove(ruta_destino)
             print(f"Archivo antiguo eliminado de: {ruta_destino}")
+
+        # 1b. Borrar los libros adicionales (shards) y su manifiesto
+        for extra in glob.glob(f"{glob.escape(base)}_[0-9][0-9][0-9]{ext}") + [f"{base}_shards.json"]:
+            if os.path.exists(extra):
+                os.remove(extra)
+                print(f"Archivo antiguo eliminado de: {extra}")
         
         # 2. Copiar la plantilla maestra al destino
         shutil.copy2(ruta_maestra, ruta_destino)
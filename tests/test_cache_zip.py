@@ -0,0 +1,79 @@
+import os
+
+import cache_zip
+from cache_zip import CacheZip
+
+LOTES = [
+    ("U", [["CC", str(i)] + [""] * 12 for i in range(5)]),
+    ("E", [[str(i)] * 8 for i in range(7)]),
+]
+
+
+def _zip(tmp_path, nombre, contenido):
+    z = tmp_path / nombre
+    z.write_bytes(contenido)
+    return z
+
+
+def test_ida_y_vuelta_por_lotes(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_zip, "LOTE_FILAS", 3)
+    cache = CacheZip(tmp_path / "c", 1)
+    clave = cache.clave(_zip(tmp_path, "a.zip", b"abc"))
+    assert cache.obtener(clave) is None
+
+    cache.guardar(clave, LOTES)
+    lotes = cache.obtener(clave)
+    assert [(t, len(f)) for t, f in lotes] == [("U", 3), ("U", 2), ("E", 3), ("E", 3), ("E", 1)]
+    assert [r for t, f in lotes if t == "E" for r in f] == LOTES[1][1]
+
+
+def test_version_distinta_no_comparte_entradas(tmp_path):
+    z = _zip(tmp_path, "a.zip", b"abc")
+    assert CacheZip(tmp_path / "c", 1).clave(z) != CacheZip(tmp_path / "c", 2).clave(z)
+
+
+def test_entrada_truncada_se_descarta(tmp_path):
+    cache = CacheZip(tmp_path / "c", 1)
+    clave = cache.clave(_zip(tmp_path, "a.zip", b"abc"))
+    cache.guardar(clave, LOTES)
+    ruta = cache._ruta(clave)
+    ruta.write_bytes(ruta.read_bytes()[:-5])
+
+    assert cache.obtener(clave) is None
+    assert not ruta.exists()
+
+
+def test_expulsion_por_tamano_y_temporales(tmp_path):
+    cache = CacheZip(tmp_path / "c", 1)
+    vieja = cache.clave(_zip(tmp_path, "a.zip", b"abc"))
+    cache.guardar(vieja, LOTES)
+    os.utime(cache._ruta(vieja), (1, 1))
+    huerfano = cache.carpeta / "x.tmp"
+    huerfano.write_bytes(b"x")
+
+    cache.max_bytes = cache._ruta(vieja).stat().st_size + 10
+    nueva = cache.clave(_zip(tmp_path, "b.zip", b"xyz"))
+    cache.guardar(nueva, LOTES)
+
+    assert not cache._ruta(vieja).exists()
+    assert cache._ruta(nueva).exists()
+    assert not huerfano.exists()
+
+
+def test_expulsion_tolera_archivos_que_no_se_pueden_borrar(tmp_path, monkeypatch):
+    cache = CacheZip(tmp_path / "c", 1)
+    vieja = cache.clave(_zip(tmp_path, "a.zip", b"abc"))
+    cache.guardar(vieja, LOTES)
+    cache.max_bytes = 0
+
+    ruta_vieja = cache._ruta(vieja)
+    original = type(ruta_vieja).unlink
+
+    def _unlink(self, missing_ok=False):
+        if self == ruta_vieja:
+            raise PermissionError("bloqueado")
+        return original(self, missing_ok=missing_ok)
+
+    monkeypatch.setattr(type(ruta_vieja), "unlink", _unlink)
+    cache.expulsar()
+    assert ruta_vieja.exists()
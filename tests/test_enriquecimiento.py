@@ -0,0 +1,134 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from enriquecimiento import (
+    FilaOrigen,
+    Modulo,
+    MotorEnriquecimiento,
+    REGLA_EXISTE_US,
+    REGLA_MAPEO,
+    REGLA_NO_EXCLUIDO,
+    REGLA_NO_VACIO,
+    REGLAS_ESTANDAR,
+    norm_servicio,
+)
+
+FECHA = date(2026, 1, 1)
+
+MAPEO = {
+    "ATRIL": {"transformacion": "ATRIL", "codigo": "ATR01"},
+    "VENTILADOR MECANICO": {"transformacion": "EQUIPO DE VENTILACION", "codigo": "VENT"},
+    "TENSIOMETRO": {"transformacion": "QUITAR", "codigo": ""},
+}
+
+
+class ExcelFalso:
+    """Expone los mismos cargadores que ExcelCOM y cuenta las lecturas."""
+
+    def __init__(self):
+        self.lecturas = 0
+
+    def cargar_us_keyset(self):
+        self.lecturas += 1
+        return {"CC|1", "CC|2", "TI|4"}
+
+    def cargar_estructura_base_lm(self):
+        self.lecturas += 1
+        return {
+            "1": {"row": 3, "L": "L1", "M": "M1"},
+            "2": {"row": 4, "L": "", "M": "M2"},
+        }
+
+    def cargar_estructura_dedupe_activos(self):
+        self.lecturas += 1
+        return {"1|VENT|2026-01-01"}
+
+
+def _fila(rownum, doc, servicio):
+    return FilaOrigen(rownum, "", doc, doc, servicio, norm_servicio(servicio))
+
+
+def _modulo_con(nombre, reglas, **kwargs):
+    return Modulo(nombre=nombre, carpeta=Path("."), mapeo_json=Path("no_existe.json"), reglas=reglas, **kwargs)
+
+
+def _modulo(nombre):
+    return _modulo_con(nombre, REGLAS_ESTANDAR)
+
+
+FILAS = [
+    _fila(2, "1", "Atril"),
+    _fila(3, "1", "ventilador mecánico"),
+    _fila(4, "2", "atril"),
+    _fila(5, "3", "atril"),
+    _fila(6, "1", "tensiometro"),
+    _fila(7, "1", "camilla"),
+    _fila(8, "", ""),
+    _fila(9, "4", "atril"),
+]
+
+
+def test_cadena_estandar_equivale_a_la_de_activos():
+    motor = MotorEnriquecimiento([_modulo("ACTIVOS")])
+    plan, descartes = motor.ejecutar(ExcelFalso(), "ACTIVOS", FILAS, FECHA, mapeo=MAPEO)
+
+    assert [(p.tipo_doc, p.doc_norm, p.codigo, p.nombre_homologado, p.l_base, p.m_base, p.base_row) for p in plan] == [
+        ("CC", "1", "ATR01", "ATRIL", "L1", "M1", 3),
+    ]
+    assert [(d["row_excel"], d["reason"]) for d in descartes] == [
+        (3, "DUPLICADO_YA_EXISTE"),
+        (4, "BASE_SIN_LM"),
+        (5, "NO_EXISTE_EN_US"),
+        (6, "SERVICIO_EXCLUIDO"),
+        (7, "NO_MAPEO_EN_JSON"),
+        (8, "DOC_O_SERV_VACIO"),
+        (9, "NO_BASE_ESTRUCTURA"),
+    ]
+
+
+def test_indices_se_leen_una_vez_para_todos_los_modulos():
+    excel = ExcelFalso()
+    motor = MotorEnriquecimiento([_modulo("ACTIVOS"), _modulo("LABORATORIOS")])
+    motor.ejecutar(excel, "ACTIVOS", FILAS, FECHA, mapeo=MAPEO)
+    motor.ejecutar(excel, "LABORATORIOS", FILAS, FECHA, mapeo=MAPEO)
+    assert excel.lecturas == 3
+
+
+def test_registrar_insertados_deduplica_entre_modulos():
+    excel = ExcelFalso()
+    motor = MotorEnriquecimiento([_modulo("ACTIVOS"), _modulo("LABORATORIOS")])
+
+    plan, _ = motor.ejecutar(excel, "ACTIVOS", FILAS, FECHA, mapeo=MAPEO)
+    assert len(plan) == 1
+    motor.registrar_insertados(plan)
+
+    plan_lab, descartes_lab = motor.ejecutar(excel, "LABORATORIOS", FILAS[:1], FECHA, mapeo=MAPEO)
+    assert plan_lab == []
+    assert descartes_lab[0]["reason"] == "DUPLICADO_YA_EXISTE"
+
+
+def test_modulo_sin_reglas_falla_al_compilar():
+    with pytest.raises(ValueError, match="ninguna regla produce"):
+        MotorEnriquecimiento([_modulo_con("VACIO", [])])
+
+
+def test_regla_que_lee_ctx_antes_de_producirse_falla_al_compilar():
+    with pytest.raises(ValueError, match="SERVICIO_EXCLUIDO"):
+        MotorEnriquecimiento([_modulo_con("MAL", [REGLA_NO_EXCLUIDO, REGLA_MAPEO])])
+
+
+def test_cadena_propia_con_constructor_propio():
+    modulo = _modulo_con("SOLO_US", [REGLA_NO_VACIO, REGLA_EXISTE_US],
+                         construir=lambda fila, ctx: (ctx["tipo"], fila.doc_norm),
+                         construir_requiere=("tipo",))
+    excel = ExcelFalso()
+    motor = MotorEnriquecimiento([modulo])
+    plan, descartes = motor.ejecutar(excel, "SOLO_US", FILAS[:4], FECHA)
+
+    assert plan == [("CC", "1"), ("CC", "1"), ("CC", "2")]
+    assert [d["reason"] for d in descartes] == ["NO_EXISTE_EN_US"]
+    # Sin reglas de ESTRUCTURA ni mapeo: solo se lee US
+    assert excel.lecturas == 1
+    assert "mapeo" not in motor.indices
@@ -0,0 +1,345 @@
+import json
+import re
+import sys
+import types
+
+import pytest
+
+# excel_com importa win32com al cargar; en este entorno se usa un módulo vacío
+# y los objetos COM se reemplazan por los falsos de abajo.
+if "win32com.client" not in sys.modules:
+    try:
+        import win32com.client  # noqa: F401
+    except ImportError:
+        _win32com = types.ModuleType("win32com")
+        _win32com.client = types.ModuleType("win32com.client")
+        sys.modules["win32com"] = _win32com
+        sys.modules["win32com.client"] = _win32com.client
+
+import excel_com
+from excel_com import ExcelCOM, arrastrar_formulas_libro
+
+FILAS_HOJA = 8
+
+
+# ==========================================================
+# EXCEL FALSO: HOJAS EN MEMORIA CON SEMÁNTICA DE End(xlUp)
+# ==========================================================
+def _col(letras):
+    n = 0
+    for ch in letras:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _vacio(v):
+    return v is None or v == ""
+
+
+class Celda:
+    def __init__(self, ws, r, c):
+        self.ws, self.Row, self.Column = ws, r, c
+
+    @property
+    def Value(self):
+        return self.ws.data.get((self.Row, self.Column))
+
+    @Value.setter
+    def Value(self, v):
+        self.ws.data[(self.Row, self.Column)] = v
+
+    @property
+    def HasFormula(self):
+        return (self.Row, self.Column) in self.ws.formulas
+
+    @property
+    def FormulaR1C1(self):
+        return self.ws.formulas[(self.Row, self.Column)]
+
+    def End(self, direccion):
+        # Como Excel: desde una celda llena salta al inicio de su bloque;
+        # desde una vacía, a la primera celda llena hacia arriba.
+        r, c, d = self.Row, self.Column, self.ws.data
+        if not _vacio(d.get((r, c))):
+            while r > 1 and not _vacio(d.get((r - 1, c))):
+                r -= 1
+        else:
+            while r > 1 and _vacio(d.get((r, c))):
+                r -= 1
+        return Celda(self.ws, r, c)
+
+
+class Rango:
+    def __init__(self, ws, a, b=None):
+        if b is None:
+            m = re.fullmatch(r"([A-Z]+)(\d+):([A-Z]+)(\d+)", a)
+            self.c1, self.r1, self.c2, self.r2 = _col(m[1]), int(m[2]), _col(m[3]), int(m[4])
+        else:
+            self.r1, self.c1, self.r2, self.c2 = a.Row, a.Column, b.Row, b.Column
+        self.ws = ws
+
+    def _celdas(self):
+        return [[(r, c) for c in range(self.c1, self.c2 + 1)] for r in range(self.r1, self.r2 + 1)]
+
+    @property
+    def Value(self):
+        return tuple(tuple(self.ws.data.get(k) for k in fila) for fila in self._celdas())
+
+    @Value.setter
+    def Value(self, filas):
+        assert self.r2 <= self.ws.Rows.Count, "escritura fuera de la hoja"
+        filas = list(filas)
+        assert len(filas) == self.r2 - self.r1 + 1
+        for fila_k, fila_v in zip(self._celdas(), filas):
+            for k, v in zip(fila_k, fila_v):
+                self.ws.data[k] = v
+
+    @property
+    def FormulaR1C1(self):
+        return None
+
+    @FormulaR1C1.setter
+    def FormulaR1C1(self, f):
+        if self.ws.falla_formulas:
+            raise RuntimeError("COM ocupado")
+        for fila in self._celdas():
+            for k in fila:
+                self.ws.formulas[k] = f
+
+
+class Hoja:
+    def __init__(self, nombre):
+        self.Name = nombre
+        self.Visible = True
+        self.Rows = types.SimpleNamespace(Count=FILAS_HOJA)
+        self.data = {}
+        self.formulas = {}
+        self.falla_formulas = False
+
+    def Cells(self, r, c):
+        return Celda(self, r, c)
+
+    def Range(self, a, b=None):
+        return Rango(self, a, b)
+
+
+class Hojas:
+    def __init__(self, libro):
+        self.libro = libro
+
+    def __call__(self, nombre):
+        return self.libro.hojas[nombre]
+
+    def Add(self):
+        hoja = Hoja("Hoja")
+        self.libro.hojas[id(hoja)] = hoja
+        return _Renombrable(self.libro, hoja)
+
+
+class _Renombrable:
+    """Al asignar Name, la hoja queda registrada con ese nombre."""
+
+    def __init__(self, libro, hoja):
+        object.__setattr__(self, "_libro", libro)
+        object.__setattr__(self, "_hoja", hoja)
+
+    def __getattr__(self, k):
+        return getattr(self._hoja, k)
+
+    def __setattr__(self, k, v):
+        setattr(self._hoja, k, v)
+        if k == "Name":
+            self._libro.hojas = {n: h for n, h in self._libro.hojas.items() if h is not self._hoja}
+            self._libro.hojas[v] = self._hoja
+
+
+class Libro:
+    def __init__(self):
+        self.hojas = {"ESTRUCTURA": Hoja("ESTRUCTURA"), "US": Hoja("US")}
+        # Fila modelo con fórmula, como la plantilla real
+        self.hojas["ESTRUCTURA"].formulas[(2, 1)] = "=RC5"
+        self.Worksheets = self.Sheets = Hojas(self)
+        self.abierto = True
+
+    def Save(self):
+        pass
+
+    def Close(self, SaveChanges=False):
+        self.abierto = False
+
+
+class ExcelApp:
+    def __init__(self, libros, aperturas):
+        self.libros, self.aperturas = libros, aperturas
+        self.Workbooks = types.SimpleNamespace(Open=self._open)
+
+    def _open(self, path, ReadOnly=False):
+        self.aperturas.append((path, ReadOnly))
+        libro = self.libros.setdefault(str(path), Libro())
+        libro.abierto = True
+        return libro
+
+    def Quit(self):
+        pass
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    libros, aperturas = {}, []
+    monkeypatch.setattr(excel_com.win32, "DispatchEx", lambda _: ExcelApp(libros, aperturas), raising=False)
+    maestra = tmp_path / "maestra.xlsm"
+    maestra.write_bytes(b"plantilla")
+    base = tmp_path / "RIPS.xlsm"
+    base.write_bytes(b"plantilla")
+    return types.SimpleNamespace(libros=libros, aperturas=aperturas, maestra=maestra, base=base, tmp=tmp_path)
+
+
+def _abrir(e, maestra=True):
+    excel = ExcelCOM(e.base, plantilla_maestra=e.maestra if maestra else None)
+    excel.abrir()
+    return excel
+
+
+def _filas(n, inicio=0):
+    return [[str(100 + inicio + i), "2026-01-01", "", "COD", "", "", "", ""] for i in range(n)]
+
+
+# ==========================================================
+# PRUEBAS
+# ==========================================================
+def test_fila_final_con_columna_llena(entorno):
+    excel = _abrir(entorno)
+    ws = excel.ws_estructura
+    for r in range(2, FILAS_HOJA + 1):
+        ws.Cells(r, 5).Value = "x"
+    assert excel.ultima_fila(ws, 5) == FILAS_HOJA
+    assert excel.siguiente_fila(ws, 5) == FILAS_HOJA + 1
+
+
+def test_pegado_rota_y_lleva_us_y_control(entorno):
+    excel = _abrir(entorno)
+    fila_us = excel.pegar_us_rango([["CC", "1"], ["TI", "2"]], 2)
+    fin = excel.pegar_estructura_rango(_filas(10), 3)
+
+    primero = entorno.libros[str(entorno.base)]
+    segundo_path = entorno.tmp / "RIPS_002.xlsm"
+    segundo = entorno.libros[str(segundo_path)]
+    assert segundo_path.read_bytes() == b"plantilla"
+    assert not primero.abierto and excel.wb is segundo
+
+    # 6 filas llenan el primer libro (3..8) y 4 siguen en el segundo (3..6)
+    assert primero.hojas["ESTRUCTURA"].data[(FILAS_HOJA, 5)] == "105"
+    assert segundo.hojas["ESTRUCTURA"].data[(3, 5)] == "106"
+    assert fin == 7
+
+    # US y control en las mismas posiciones; las claves US se conservan
+    assert segundo.hojas["US"].data[(2, 1)] == "CC" and segundo.hojas["US"].data[(3, 2)] == "2"
+    control = segundo.hojas[excel_com.CONTROL_SHEET]
+    assert (control.data[(2, 2)], control.data[(3, 2)]) == ("CC|1", "TI|2")
+    assert excel.pegar_us_rango([["CC", "1"]], fila_us) == fila_us
+
+    excel.cerrar()
+    manifest = json.loads(excel.manifest_path.read_text(encoding="utf-8"))
+    assert [(s["archivo"], s["estructura_desde"], s["estructura_hasta"]) for s in manifest["shards"]] == [
+        ("RIPS.xlsm", 3, 8),
+        ("RIPS_002.xlsm", 3, 6),
+    ]
+
+
+def test_reanuda_desde_el_manifiesto(entorno):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(10), 3)
+    excel.cerrar()
+
+    otra = _abrir(entorno)
+    assert otra.path == str(entorno.tmp / "RIPS_002.xlsm")
+    assert otra.siguiente_fila(otra.ws_estructura, 5) == 7
+
+
+def test_libro_lleno_al_reanudar_rota_en_vez_de_sobrescribir(entorno):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(6), 3)
+    excel.cerrar()
+
+    otra = _abrir(entorno)
+    fila = otra.siguiente_fila(otra.ws_estructura, 5)
+    otra.pegar_estructura_rango(_filas(1, inicio=50), fila)
+
+    assert entorno.libros[str(entorno.base)].hojas["ESTRUCTURA"].data[(3, 5)] == "100"
+    assert entorno.libros[str(entorno.tmp / "RIPS_002.xlsm")].hojas["ESTRUCTURA"].data[(3, 5)] == "150"
+
+
+def test_shards_cerrados_y_marcar_formulas(entorno):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(10), 3)
+    cerrados = excel.shards_cerrados()
+    assert cerrados == [str(entorno.base)]
+
+    excel.marcar_formulas(cerrados)
+    assert excel.shards_cerrados() == []
+    manifest = json.loads(excel.manifest_path.read_text(encoding="utf-8"))
+    assert [s["formulas"] for s in manifest["shards"]] == [True, False]
+
+
+def test_relleno_de_formulas_llega_a_la_ultima_fila(entorno):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(10), 3)
+    excel.cerrar()
+
+    assert arrastrar_formulas_libro(str(entorno.base)) == FILAS_HOJA
+    formulas = entorno.libros[str(entorno.base)].hojas["ESTRUCTURA"].formulas
+    assert formulas[(FILAS_HOJA, 1)] == "=RC5"
+
+
+def test_relleno_fallido_no_cuenta_como_exito(entorno):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(10), 3)
+    excel.cerrar()
+
+    entorno.libros[str(entorno.base)].hojas["ESTRUCTURA"].falla_formulas = True
+    with pytest.raises(RuntimeError, match="incompleto"):
+        arrastrar_formulas_libro(str(entorno.base))
+
+
+def test_indices_de_todos_los_shards_en_una_lectura(entorno):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(10), 3)
+    entorno.aperturas.clear()
+
+    base = excel.cargar_estructura_base_lm()
+    dupes = excel.cargar_estructura_dedupe_activos()
+
+    assert base["100"]["shard"] == 1 and base["109"]["shard"] == 2
+    assert {"100|COD|2026-01-01", "109|COD|2026-01-01"} <= dupes
+    assert entorno.aperturas == [(str(entorno.base), True)]
+
+
+def test_sin_maestra_la_rotacion_falla_con_mensaje(entorno):
+    excel = _abrir(entorno, maestra=False)
+    with pytest.raises(RuntimeError, match="plantilla maestra"):
+        excel.pegar_estructura_rango(_filas(10), 3)
+
+
+def test_no_sobrescribe_un_shard_existente(entorno):
+    (entorno.tmp / "RIPS_002.xlsm").write_bytes(b"datos")
+    excel = _abrir(entorno)
+    with pytest.raises(RuntimeError, match="no se sobrescribe"):
+        excel.pegar_estructura_rango(_filas(10), 3)
+    assert (entorno.tmp / "RIPS_002.xlsm").read_bytes() == b"datos"
+
+
+def test_abrir_fallido_no_vacia_el_manifiesto(entorno, monkeypatch):
+    excel = _abrir(entorno)
+    excel.pegar_estructura_rango(_filas(10), 3)
+    excel.cerrar()
+    antes = excel.manifest_path.read_text(encoding="utf-8")
+
+    def _falla(_):
+        raise OSError("sin Excel")
+
+    monkeypatch.setattr(excel_com.win32, "DispatchEx", _falla)
+    otra = ExcelCOM(entorno.base, plantilla_maestra=entorno.maestra)
+    with pytest.raises(OSError):
+        otra.abrir()
+    otra.cerrar()
+    assert excel.manifest_path.read_text(encoding="utf-8") == antes